@@ -5,9 +5,11 @@ import getpass
 import logging
 import random
 import glob
+import json
 import re
-from collections import defaultdict
-from functools import partial
+import zlib
+from collections import Counter, defaultdict, deque
+from functools import lru_cache
 from copy import deepcopy
 from datetime import datetime, timedelta
 from time import sleep
@@ -113,13 +115,150 @@ def update_config(config, args):
         data[key] = value
 
 
+ZLIB_MAX_DICT_SIZE = 32 * 1024
+
+
+def train_dictionary(samples, size=ZLIB_MAX_DICT_SIZE):
+    counter = Counter()
+    for sample in samples:
+        for line in set(sample.splitlines(keepends=True)):
+            counter[line] += 1
+
+    lines = [(len(line) * (count - 1), line) for line, count in counter.items() if count > 1]
+    lines.sort(reverse=True)
+
+    ret = []
+    total = 0
+    for _, line in lines:
+        if total + len(line) > size:
+            continue
+        ret.append(line)
+        total += len(line)
+    # zlib finds matches for the end of dictionary with the shortest distances
+    return b''.join(ret[::-1])
+
+
+@lru_cache(maxsize=None)
+def load_segment(segment_file):
+    with open(f'{segment_file}.json', 'r') as fo:
+        index = json.load(fo)
+    with open(f'{segment_file}.dict', 'rb') as fo:
+        dictionary = fo.read()
+    return index, dictionary
+
+
+def read_segment_game(segment_file, game_id):
+    index, dictionary = load_segment(segment_file)
+    offset, length = index['games'][game_id]
+    with open(f'{segment_file}.pack', 'rb') as fo:
+        fo.seek(offset)
+        compressed = fo.read(length)
+    decompressor = zlib.decompressobj(zdict=dictionary)
+    return decompressor.decompress(compressed) + decompressor.flush()
+
+
+def write_segment(segment_file, payloads):
+    dictionary = train_dictionary(payloads.values())
+    games = {}
+    offset = 0
+    with open(f'{segment_file}.pack.tmp', 'wb') as fo:
+        for game_id, payload in payloads.items():
+            compressor = zlib.compressobj(level=9, zdict=dictionary)
+            compressed = compressor.compress(payload) + compressor.flush()
+            fo.write(compressed)
+            games[game_id] = [offset, len(compressed)]
+            offset += len(compressed)
+    with open(f'{segment_file}.dict', 'wb') as fo:
+        fo.write(dictionary)
+    os.replace(f'{segment_file}.pack.tmp', f'{segment_file}.pack')
+    # index is written last, the segment is visible only when it is complete
+    with open(f'{segment_file}.json.tmp', 'w') as fo:
+        json.dump({'games': games}, fo)
+    os.replace(f'{segment_file}.json.tmp', f'{segment_file}.json')
+
+
+def parse_number(value):
+    match = re.search(r'[0-9]+(?:\.[0-9]+)?', str(value))
+    return float(match.group(0)) if match else None
+
+
+def rating_delta(rating_changes):
+    # ratingChanges of gameInformation is a list of rating deltas in order of gameParticipants
+    if isinstance(rating_changes, (int, float)) and not isinstance(rating_changes, bool):
+        return rating_changes
+    return None
+
+
+def rollup_values(participant):
+    ret = {
+        'games': 1,
+        'wins': int(participant['rank'] == 1),
+        'rank_sum': participant['rank'],
+    }
+    delta = rating_delta(participant.get('ratingChanges'))
+    if delta is not None:
+        ret['rated'] = 1
+        ret['rating_delta'] = delta
+    for key in 'time', 'memory':
+        value = parse_number(participant.get(key))
+        if value is not None:
+            ret[f'{key}_count'] = 1
+            ret[f'{key}_sum'] = value
+    return ret
+
+
+def parse_game(game_data):
+    info = game_data['game']
+    ret = {
+        'info': info,
+        'participants': [],
+        'users': {},
+    }
+    rating_changes = game_data.get('ratingChanges')
+
+    users = game_data['usersRaw'] or game_data['users']
+    ret['users'] = {u['login'] for u in users}
+
+    for idx, participant in enumerate(game_data['gameParticipants']):
+        if rating_changes:
+            participant['ratingChanges'] = rating_changes[idx]
+
+        for line in participant['strategyProtocol'].split('\n')[::-1]:
+            line = line.strip()
+            if line.startswith('Consumed time'):
+                participant['time'] = line.split(':')[-1].strip()
+            elif line.startswith('Memory used'):
+                participant['memory'] = line.split(':')[-1].strip()
+                break
+
+        ret['participants'].append(participant)
+
+    info['creation_time'] = parser.parse(info['creationTime'])
+    return ret
+
+
+def load_game_source(source):
+    game_id, game_file, segment_file = source
+    if segment_file:
+        return yaml.safe_load(read_segment_game(segment_file, game_id))
+    with open(game_file, 'r') as fo:
+        return yaml.safe_load(fo)
+
+
+def read_game_source(source):
+    return parse_game(load_game_source(source))
+
+
 class UserFolder:
 
     def __init__(self, username, cache_folder):
         self.username = username
         self.folder = os.path.join(cache_folder, username)
         self.games_folder = os.path.join(self.folder, 'games')
+        self.archive_folder = os.path.join(self.folder, 'archive')
         ensure_folder(self.games_folder)
+        self._segments = None
+        self._archived = None
 
     @property
     def data_file(self):
@@ -141,60 +280,217 @@ class UserFolder:
         with open(self.data_file, 'w') as fo:
             yaml.dump(data, fo, indent=2)
 
+    @staticmethod
+    def game_key(game_id):
+        return f'{game_id:>08s}'
+
     def game_file(self, game_id):
-        game_id = f'{game_id:>08s}'
+        game_id = self.game_key(game_id)
         filepath = os.path.join(self.games_folder, game_id[:4], f'{game_id}.yaml')
         ensure_folder(os.path.dirname(filepath))
         return filepath
 
-    def exists_game(self, game_id):
-        return os.path.exists(self.game_file(game_id))
-
-    def read_game(self, game_file):
-        with open(game_file, 'r') as fo:
-            game_data = yaml.safe_load(fo)
-
-        info = game_data['game']
-        ret = {
-            'info': info,
-            'participants': [],
-            'users': {},
-        }
-        rating_changes = game_data.get('ratingChanges')
-
-        users = game_data['usersRaw'] or game_data['users']
-        ret['users'] = {u['login'] for u in users}
+    def segment_files(self):
+        files = glob.glob(os.path.join(self.archive_folder, '*.json'))
+        return sorted(os.path.splitext(f)[0] for f in files)
+
+    def segments(self):
+        if self._segments is None:
+            segments = []
+            for segment_file in self.segment_files():
+                _, first_game_id, last_game_id = os.path.basename(segment_file).split('-')
+                segments.append((first_game_id, last_game_id, segment_file))
+            self._segments = segments
+        return self._segments
+
+    def segment_for_game(self, game_id):
+        game_id = self.game_key(game_id)
+        # segment name has range of game ids, so only the index of matched segment is loaded
+        for first_game_id, last_game_id, segment_file in self.segments():
+            if first_game_id <= game_id <= last_game_id:
+                index, _ = load_segment(segment_file)
+                if game_id in index['games']:
+                    return segment_file
+        return None
+
+    def archived_games(self):
+        if self._archived is None:
+            archived = {}
+            for segment_file in self.segment_files():
+                index, _ = load_segment(segment_file)
+                for game_id in index['games']:
+                    archived[game_id] = segment_file
+            self._archived = archived
+        return self._archived
+
+    def hot_games(self):
+        files = glob.glob(os.path.join(self.games_folder, '**/*.yaml'))
+        return {os.path.splitext(os.path.basename(f))[0]: f for f in files}
 
-        for idx, participant in enumerate(game_data['gameParticipants']):
-            if rating_changes:
-                participant['ratingChanges'] = rating_changes[idx]
+    def exists_game(self, game_id):
+        return os.path.exists(self.game_file(game_id)) or self.segment_for_game(game_id) is not None
 
-            for line in participant['strategyProtocol'].split('\n')[::-1]:
-                line = line.strip()
-                if line.startswith('Consumed time'):
-                    participant['time'] = line.split(':')[-1].strip()
-                elif line.startswith('Memory used'):
-                    participant['memory'] = line.split(':')[-1].strip()
-                    break
+    def game_source(self, game_id):
+        game_id = self.game_key(game_id)
+        segment_file = self.segment_for_game(game_id)
+        if segment_file:
+            return game_id, None, segment_file
+        return game_id, self.game_file(game_id), None
 
-            ret['participants'].append(participant)
+    def load_game(self, game_id):
+        return load_game_source(self.game_source(game_id))
 
-        info['creation_time'] = parser.parse(info['creationTime'])
-        return ret
+    def read_game(self, game_id):
+        return read_game_source(self.game_source(game_id))
 
     def write_game(self, game_id, data):
         with open(self.game_file(game_id), 'w') as fo:
             yaml.dump(data, fo, indent=2)
 
-    def games(self):
-        files = glob.glob(os.path.join(self.games_folder, '**/*.yaml'))
-        files.sort(reverse=True)
+    def game_ids(self):
+        return self.hot_games().keys() | self.archived_games().keys()
+
+    def games(self, game_ids=None):
+        hot_games = self.hot_games()
+        archived_games = self.archived_games()
+        if game_ids is None:
+            game_ids = hot_games.keys() | archived_games.keys()
 
-        with ProcessPoolExecutor() as executor, tqdm.tqdm(total=len(files), leave=True) as pbar:
-            for game in executor.map(partial(self.read_game), files):
+        # sources are passed instead of self to not pickle the archive index with each game
+        sources = []
+        for game_id in sorted(game_ids, reverse=True):
+            if game_id in hot_games:
+                sources.append((game_id, hot_games[game_id], None))
+            else:
+                sources.append((game_id, None, archived_games[game_id]))
+
+        with ProcessPoolExecutor() as executor, tqdm.tqdm(total=len(sources), leave=True) as pbar:
+            for game in executor.map(read_game_source, sources, chunksize=64):
                 pbar.update()
                 yield game
 
+    @property
+    def rollups_file(self):
+        return os.path.join(self.folder, 'rollups.json')
+
+    def read_rollups(self):
+        rollups = {'game_ids': set(), 'strategies': {}}
+        rollups_file = self.rollups_file
+        if os.path.exists(rollups_file):
+            with open(rollups_file, 'r') as fo:
+                data = json.load(fo)
+            rollups['game_ids'] = set(data['game_ids'])
+            for strategy, contest_id, stat in data['stats']:
+                rollups['strategies'].setdefault(strategy, {})[contest_id] = stat
+        return rollups
+
+    def write_rollups(self, rollups):
+        data = {
+            'game_ids': sorted(rollups['game_ids']),
+            'stats': [
+                [strategy, contest_id, stat]
+                for strategy, contests in rollups['strategies'].items()
+                for contest_id, stat in contests.items()
+            ],
+        }
+        with open(f'{self.rollups_file}.tmp', 'w') as fo:
+            json.dump(data, fo)
+        os.replace(f'{self.rollups_file}.tmp', self.rollups_file)
+
+    def update_rollups(self, user_id, game_ids=None):
+        built = os.path.exists(self.rollups_file)
+        rollups = self.read_rollups()
+        if game_ids is None:
+            # the whole cache is checked only on the first build, then fetch_games adds new games
+            if built:
+                return rollups
+            game_ids = self.game_ids()
+        game_ids = set(game_ids) - rollups['game_ids']
+        if not game_ids and built:
+            return rollups
+
+        n_unexpected = 0
+        for game in self.games(game_ids):
+            participant = next((p for p in game['participants'] if p['userId'] == user_id), None)
+            if participant is None:
+                continue
+            rating_changes = participant.get('ratingChanges')
+            if rating_changes is not None and rating_delta(rating_changes) is None:
+                n_unexpected += 1
+                logger.debug(f'Skip unexpected rating change {rating_changes!r} in game {game["info"]["id"]}')
+            contest_id = game['info'].get('contestId')
+            stat = rollups['strategies'].setdefault(participant['strategyVersion'], {}).setdefault(contest_id, {})
+            for key, value in rollup_values(participant).items():
+                stat[key] = stat.get(key, 0) + value
+
+        if n_unexpected:
+            logger.warning(f'Skip unexpected rating changes in {n_unexpected} games')
+
+        rollups['game_ids'] |= game_ids
+        self.write_rollups(rollups)
+        return rollups
+
+    def compact(self, keep_games, keep_days=None, segment_size=1000):
+        hot_games = self.hot_games()
+        game_ids = sorted(hot_games, reverse=True)[keep_games:]
+        game_ids.sort()
+        # only full segments are archived, the rest stays hot until the next compact
+        game_ids = game_ids[:len(game_ids) - len(game_ids) % segment_size]
+
+        ensure_folder(self.archive_folder)
+        stat = defaultdict(float)
+        n_segment = len(self.segment_files())
+        for idx in range(0, len(game_ids), segment_size):
+            payloads = {}
+            for game_id in game_ids[idx:idx + segment_size]:
+                with open(hot_games[game_id], 'rb') as fo:
+                    payloads[game_id] = fo.read()
+            if keep_days is not None:
+                # game ids grow with creation time, so the batch is cold if its last game is
+                info = yaml.safe_load(payloads[max(payloads)])['game']
+                creation_time = parser.parse(info['creationTime']).astimezone()
+                if creation_time > datetime.now().astimezone() - timedelta(days=keep_days):
+                    break
+            segment_file = os.path.join(self.archive_folder, f'{n_segment:06d}-{min(payloads)}-{max(payloads)}')
+            n_segment += 1
+
+            start_time = datetime.now()
+            write_segment(segment_file, payloads)
+            stat['compress_time'] += (datetime.now() - start_time).total_seconds()
+
+            start_time = datetime.now()
+            for game_id, payload in payloads.items():
+                assert read_segment_game(segment_file, game_id) == payload, f'Archived game {game_id} is corrupted'
+            stat['decompress_time'] += (datetime.now() - start_time).total_seconds()
+
+            for game_id in payloads:
+                os.remove(hot_games[game_id])
+                hot_dir = os.path.dirname(hot_games[game_id])
+                if not os.listdir(hot_dir):
+                    os.rmdir(hot_dir)
+            stat['compacted'] += len(payloads)
+            stat['raw_size'] += sum(len(p) for p in payloads.values())
+            stat['compacted_size'] += self.segment_disk_size(segment_file)
+        self._segments = None
+        self._archived = None
+        return stat
+
+    def storage_stat(self):
+        hot_games = self.hot_games()
+        segment_files = self.segment_files()
+        stat = {
+            'hot': len(hot_games),
+            'hot_size': sum(os.path.getsize(f) for f in hot_games.values()),
+            'archived': len(self.archived_games()),
+            'segments': len(segment_files),
+            'archive_size': sum(self.segment_disk_size(segment_file) for segment_file in segment_files),
+        }
+        return stat
+
+    @staticmethod
+    def segment_disk_size(segment_file):
+        return sum(os.path.getsize(f'{segment_file}.{ext}') for ext in ('pack', 'dict', 'json'))
+
 
 class RAIC:
 
@@ -436,6 +732,17 @@ class RAIC:
         if not game_ids:
             return
 
+        fetched = self.fetch_game_data(user, game_ids)
+        user_data['last_game_id'] = game_ids[0]
+        user_data['total_num_pages'] = total_num_pages
+        user.write_data(user_data)
+
+        # rollups are built on the first ratings query, here only new games are added
+        if fetched and os.path.exists(user.rollups_file):
+            user.update_rollups(self.resolve_user_id(username), fetched)
+
+    def fetch_game_data(self, user, game_ids):
+
         def fetch_and_save_game_data(game_id):
             if user.exists_game(game_id):
                 return
@@ -444,31 +751,34 @@ class RAIC:
                 'csrf_token': self.csrf_token,
             })
             user.write_game(game_id, data)
+            return user.game_key(game_id)
 
+        fetched = []
         with ThreadPoolExecutor() as executor, tqdm.tqdm(total=len(game_ids), leave=False) as pbar:
-            for _ in executor.map(fetch_and_save_game_data, game_ids):
+            for game_id in executor.map(fetch_and_save_game_data, game_ids):
+                if game_id:
+                    fetched.append(game_id)
                 pbar.update()
-
-        user_data['last_game_id'] = game_ids[0]
-        user_data['total_num_pages'] = total_num_pages
-
-        user.write_data(user_data)
+        return fetched
+
+    def resolve_user_id(self, username):
+        user_folder = UserFolder(username, self.cache_folder)
+        user_id = user_folder.user_id()
+        if user_id is None:
+            response = self.get(f'/profile/{username}')
+            user_id = self.user_id(response.content.decode('utf8'))
+            assert user_id, 'User id must be got'
+            user_data = user_folder.read_data()
+            user_data['user_id'] = user_id
+            user_folder.write_data(user_data)
+        return user_id
 
     def games(self, username):
         user = UserFolder(username, self.cache_folder)
         for game in user.games():
             users_by_id = {}
             for username in game['users']:
-                user_folder = UserFolder(username, self.cache_folder)
-                user_id = user_folder.user_id()
-                if user_id is None:
-                    response = self.get(f'/profile/{username}')
-                    user_id = self.user_id(response.content.decode('utf8'))
-                    assert user_id, 'User id must be got'
-                    user_data = user_folder.read_data()
-                    user_data['user_id'] = user_id
-                    user_folder.write_data(user_data)
-                users_by_id[user_id] = username
+                users_by_id[self.resolve_user_id(username)] = username
 
             participants = {}
             for p in game['participants']:
@@ -481,13 +791,159 @@ class RAIC:
     def game_url(self, game_id):
         return urljoin(self.host, f'/game/view/{game_id}')
 
+    CONTESTS = {
+        'sandbox': 1,
+        'round1': 2,
+        'round2': 3,
+        'finals': 4,
+    }
+
     def contest_id(self, name):
-        return {
-            'sandbox': 1,
-            'round1': 2,
-            'round2': 3,
-            'finals': 4,
-        }[name]
+        return self.CONTESTS[name]
+
+    def contest_name(self, contest_id):
+        for name, value in self.CONTESTS.items():
+            if value == contest_id:
+                return name
+        return '' if contest_id is None else str(contest_id)
+
+
+class RateLimit:
+
+    def __init__(self, limit_game=None, limit_delay=None):
+        self.limit_game = limit_game
+        self.limit_delay = limit_delay
+        self.timing = deque()
+
+    @property
+    def known(self):
+        return self.limit_game is not None and self.limit_delay is not None
+
+    def wait(self):
+        if not self.known:
+            return
+        while len(self.timing) > self.limit_game:
+            self.timing.popleft()
+        now = datetime.now()
+        while self.timing and self.timing[0] + timedelta(minutes=self.limit_delay) <= now:
+            self.timing.popleft()
+        if len(self.timing) == self.limit_game:
+            wait(self.timing.popleft() + timedelta(minutes=self.limit_delay))
+
+    def record(self):
+        self.timing.append(datetime.now())
+
+    def failed(self, errors):
+        for error in errors:
+            match = re.search('You can not create more than ([0-9]+) games in ([0-9]+) minutes', error)
+            if match:
+                break
+        else:
+            return False
+
+        self.limit_game = int(match.group(1))
+        self.limit_delay = int(match.group(2))
+        # with the full window the next wait is until the oldest game leaves it
+        if len(self.timing) < self.limit_game:
+            wait(self.failure_delay())
+        return True
+
+    def failure_delay(self):
+        if self.known:
+            return timedelta(minutes=self.limit_delay / self.limit_game)
+        return timedelta(minutes=60)
+
+
+class GameScheduler:
+
+    def __init__(self, raic, templates, rate_limit, allow_duplicate_users=False, max_failures=3):
+        self.raic = raic
+        self.templates = templates
+        self.rate_limit = rate_limit
+        self.allow_duplicate_users = allow_duplicate_users
+        self.max_failures = max_failures
+        self.current_weights = {name: 0 for name in templates}
+        self.retry_after = {}
+        self.stats = {name: defaultdict(int) for name in templates}
+        self.rate_limited = 0
+        self.start_time = None
+
+    def weight(self, name):
+        return self.templates[name].get('weight', 1)
+
+    def next_template(self):
+        now = datetime.now()
+        names = [name for name in self.current_weights if self.retry_after.get(name, now) <= now]
+        if not names:
+            wait(min(self.retry_after[name] for name in self.current_weights))
+            return self.next_template()
+
+        # smooth weighted round-robin spreads templates evenly over the limit window
+        total = 0
+        for name in names:
+            self.current_weights[name] += self.weight(name)
+            total += self.weight(name)
+        name = max(names, key=self.current_weights.get)
+        self.current_weights[name] -= total
+        return name
+
+    def template_failed(self, name):
+        stat = self.stats[name]
+        stat['failed'] += 1
+        stat['failures_in_row'] += 1
+        # the last template is never dropped, it is retried after delay as other failed ones
+        if stat['failures_in_row'] >= self.max_failures and len(self.current_weights) > 1:
+            logger.error(f'Drop template "{name}" after {self.max_failures} failures in a row')
+            self.current_weights.pop(name)
+            stat['dropped'] = True
+        else:
+            self.retry_after[name] = datetime.now() + self.rate_limit.failure_delay()
+
+    def run(self, limit=1):
+        self.start_time = datetime.now()
+        name = None
+        while True:
+            if name is None:
+                name = self.next_template()
+            template = self.templates[name]
+            self.rate_limit.wait()
+            try:
+                logger.info(f'[{name}]')
+                self.raic.create_game(template['users'], template['formats'], self.allow_duplicate_users)
+            except CreateGameFailed as e:
+                if self.rate_limit.failed(e.args[0]):
+                    self.rate_limited += 1
+                    continue
+                self.template_failed(name)
+                name = None
+                continue
+
+            self.rate_limit.record()
+            self.stats[name]['created'] += 1
+            self.stats[name]['failures_in_row'] = 0
+            name = None
+
+            if limit:
+                limit -= 1
+                if not limit:
+                    break
+
+    def report(self):
+        table = PrettyTable(['template', 'weight', 'created', 'failed', 'share', 'games/hour', 'dropped'])
+        table.align['template'] = 'l'
+        hours = (datetime.now() - self.start_time).total_seconds() / 3600 if self.start_time else 0
+        total = sum(stat['created'] for stat in self.stats.values())
+        for name, stat in self.stats.items():
+            table.add_row([
+                name,
+                self.weight(name),
+                stat['created'],
+                stat['failed'],
+                f"{stat['created'] / total:.3f}" if total else '',
+                f"{stat['created'] / hours:.2f}" if hours else '',
+                '*' if stat['dropped'] else '',
+            ])
+        return f'{table}\nRate limit hits: {self.rate_limited}'
 
 
 class Main:
@@ -508,38 +964,28 @@ class Main:
         self._raic.signin()
 
     @only_allow_defined_args
-    def create_game(self, limit=1, limit_game=None, limit_delay=None, allow_duplicate_users=False):
-        timing = []
-        create_game = self._config['create-game']
-        while True:
-            if limit_game:
-                while len(timing) > limit_game:
-                    timing.pop(0)
-                if len(timing) == limit_game:
-                    wait(timing.pop(0) + timedelta(minutes=limit_delay))
-
-            while True:
-                try:
-                    self._raic.create_game(create_game['users'], create_game['formats'], allow_duplicate_users)
-                    timing.append(datetime.now())
-                    break
-                except CreateGameFailed as e:
-                    for error in e.args[0]:
-                        match = re.search('You can not create more than ([0-9]+) games in ([0-9]+) minutes', error)
-                        if match:
-                            limit_game = int(match.group(1))
-                            limit_delay = int(match.group(2))
-                    if limit_delay is not None and limit_game is not None:
-                        delay_on_failed = limit_delay / limit_game
-                    else:
-                        delay_on_failed = 60
-                    wait(timedelta(minutes=delay_on_failed))
-                    continue
-
-            if limit:
-                limit -= 1
-                if not limit:
-                    break
+    def create_game(
+        self, limit=1, limit_game=None, limit_delay=None, allow_duplicate_users=False, templates=None, max_failures=3,
+    ):
+        config = self._config['create-game']
+        if 'templates' in config:
+            all_templates = config['templates']
+        else:
+            all_templates = {'default': config}
+        if templates:
+            if isinstance(templates, str):
+                templates = [templates]
+            for name in templates:
+                if name not in all_templates:
+                    raise ValueError(f"Unknown template '{name}', expected: [{', '.join(all_templates)}]")
+            all_templates = {name: all_templates[name] for name in templates}
+
+        rate_limit = RateLimit(limit_game, limit_delay)
+        scheduler = GameScheduler(self._raic, all_templates, rate_limit, allow_duplicate_users, max_failures)
+        try:
+            scheduler.run(limit)
+        finally:
+            print(scheduler.report())
 
     def find_games(self, username, limit=10, **kwargs):
         self._raic.fetch_games(username)
@@ -666,6 +1112,106 @@ class Main:
                 ret['total'] = total
             return ret
 
+    def ratings(self, username, **kwargs):
+        config = deepcopy(self._config['ratings'])
+        update_config(config, kwargs)
+
+        group_by = config.get('group_by', 'strategy')
+        if isinstance(group_by, str):
+            group_by = [group_by]
+        group_keys = ('strategy', 'contest')
+        for key in group_by:
+            if key not in group_keys:
+                raise ValueError(f"Unknown group by '{key}', expected: [{', '.join(group_keys)}]")
+
+        self._raic.fetch_games(username)
+        user = UserFolder(username, self._raic.cache_folder)
+        rollups = user.update_rollups(self._raic.resolve_user_id(username))
+
+        strategies = config.get('strategies')
+        if strategies is not None:
+            if isinstance(strategies, int):
+                strategies = [strategies]
+            strategies = set(strategies)
+
+        contest = config.get('contest')
+        if contest:
+            contest_id = self._raic.contest_id(contest)
+
+        groups = {}
+        for strategy, contests in rollups['strategies'].items():
+            if strategies is not None and strategy not in strategies:
+                continue
+            for c_id, stat in contests.items():
+                if contest and contest_id != c_id:
+                    continue
+                values = {'strategy': strategy, 'contest': self._raic.contest_name(c_id)}
+                key = tuple(values[k] for k in group_by)
+                group = groups.setdefault(key, defaultdict(float, {k: values[k] for k in group_by}))
+                for k, v in stat.items():
+                    group[k] += v
+
+        table = pretty_table_from_dict(config)
+        for group in groups.values():
+            values = dict(group)
+            values['games'] = int(group['games'])
+            values['win'] = f"{group['wins'] / group['games']:.3f}"
+            values['rank'] = f"{group['rank_sum'] / group['games']:.2f}"
+            if group['rated']:
+                values['delta'] = f"{group['rating_delta']:+g}"
+                values['avg_delta'] = f"{group['rating_delta'] / group['rated']:+.2f}"
+            for k in 'time', 'memory':
+                if group[f'{k}_count']:
+                    values[k] = f"{group[f'{k}_sum'] / group[f'{k}_count']:.2f}"
+            table.add_row([values.get(k, '') for k in table.field_names])
+        print(table)
+
+    @only_allow_defined_args
+    def compact(self, username=None, keep_games=None, keep_days=None, segment_size=None):
+        config = self._config.get('compact', {})
+        keep_games = config.get('keep_games', 1000) if keep_games is None else keep_games
+        keep_days = config.get('keep_days') if keep_days is None else keep_days
+        segment_size = config.get('segment_size', 1000) if segment_size is None else segment_size
+
+        if username:
+            usernames = [username]
+        else:
+            cache_folder = self._raic.cache_folder
+            usernames = []
+            if os.path.isdir(cache_folder):
+                usernames = sorted(u for u in os.listdir(cache_folder) if os.path.isdir(os.path.join(cache_folder, u)))
+
+        def size(value):
+            return f'{value / 2 ** 20:.2f}'
+
+        def speed(value, seconds):
+            return f'{value / 2 ** 20 / seconds:.2f}' if seconds else ''
+
+        table = PrettyTable([
+            'user', 'compacted', 'raw MB', 'compacted MB', 'ratio', 'compress MB/s', 'decompress MB/s',
+            'hot', 'hot MB', 'archived', 'archive MB',
+        ])
+        table.align['user'] = 'l'
+        for username in usernames:
+            user = UserFolder(username, self._raic.cache_folder)
+            stat = user.compact(keep_games=keep_games, keep_days=keep_days, segment_size=segment_size)
+            storage = user.storage_stat()
+            raw_size = stat['raw_size']
+            table.add_row([
+                username,
+                int(stat['compacted']),
+                size(raw_size),
+                size(stat['compacted_size']),
+                f"{raw_size / stat['compacted_size']:.1f}" if stat['compacted_size'] else '',
+                speed(raw_size, stat['compress_time']),
+                speed(raw_size, stat['decompress_time']),
+                storage['hot'],
+                size(storage['hot_size']),
+                storage['archived'],
+                size(storage['archive_size']),
+            ])
+        print(table)
+
     def win_rates(self, **kwargs):
         config = deepcopy(self._config['win-rates'])
         users = self._raic.top(config['sources'])